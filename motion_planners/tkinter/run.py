@@ -2,13 +2,16 @@ from __future__ import print_function
 
 import numpy as np
 import argparse
+import os
 import time
 import random
 
+from concurrent.futures import ProcessPoolExecutor
+
 from ..meta import solve
-from ..trajectory.linear import solve_multi_linear
+from ..trajectory.linear import solve_multi_linear, opt_straight_line_durations
 from ..trajectory.discretize import time_discretize_curve, V_MAX, A_MAX
-from .samplers import get_sample_fn, get_collision_fn, get_extend_fn, get_distance_fn
+from .samplers import get_sample_fn, get_collision_fn, get_batch_collision_fn, get_extend_fn, get_distance_fn
 from ..trajectory.smooth import smooth_curve, get_curve_collision_fn
 from ..trajectory.limits import analyze_continuity
 from .viewer import create_box, draw_environment, add_points, \
@@ -47,7 +50,16 @@ def dump_spline(positions_curve):
     for d in range(positions_curve.c.shape[-1]):
         print(d, positions_curve.c[..., d])
 
-def retime_path(path, collision_fn=lambda q: False, smooth=False, **kwargs):
+def interpolate_path(path, v_max=V_MAX, a_max=A_MAX):
+    from scipy.interpolate import CubicHermiteSpline
+    waypoints = remove_redundant(path)
+    waypoints = np.asarray(waypoints_from_path(waypoints), dtype=np.float64) # (N, d)
+    durations = opt_straight_line_durations(waypoints, v_max, a_max)
+    times = np.cumsum(durations)
+    velocities = np.zeros_like(waypoints) # Rest at each waypoint
+    return CubicHermiteSpline(times, waypoints, dydx=velocities)
+
+def retime_path(path, collision_fn=lambda q: False, batch_collision_fn=None, smooth=False, **kwargs):
     d = len(path[0])
     # v_max = 5.*np.ones(d)
     # a_max = v_max / 1.
@@ -55,7 +67,7 @@ def retime_path(path, collision_fn=lambda q: False, smooth=False, **kwargs):
     print('Max vel: {} | Max accel: {}'.format(v_max, a_max))
 
     waypoints = remove_redundant(path)
-    waypoints = waypoints_from_path(waypoints)
+    waypoints = np.asarray(waypoints_from_path(waypoints), dtype=np.float64) # (N, d)
     positions_curve = solve_multi_linear(waypoints, v_max, a_max)
     if not smooth:
         return positions_curve
@@ -63,8 +75,7 @@ def retime_path(path, collision_fn=lambda q: False, smooth=False, **kwargs):
     # durations = [0.] + [get_distance(*pair) / velocity for pair in get_pairs(waypoints)]
     # durations = [0.] + [solve_multivariate_ramp(x1, x2, np.zeros(d), np.zeros(d), v_max, a_max)
     #                     for x1, x2 in get_pairs(waypoints)]
-    # durations = [0.] + [max(spline_duration(opt_straight_line(x1[k], x2[k], v_max=v_max[k], a_max=a_max[k])) for k in range(d))
-    #                    for x1, x2 in get_pairs(waypoints)] # min_linear_spline | opt_straight_line
+    # durations = opt_straight_line_durations(waypoints, v_max, a_max) # min_linear_spline | opt_straight_line
     # times = np.cumsum(durations)
 
     #positions_curve = interp1d(times, waypoints, kind='quadratic', axis=0) # linear | slinear | quadratic | cubic
@@ -89,7 +100,8 @@ def retime_path(path, collision_fn=lambda q: False, smooth=False, **kwargs):
     # print(positions_curve.x)
     # print([positions_curve(t) for t in [t1, t2]])
 
-    curve_collision_fn = get_curve_collision_fn(collision_fn, max_velocities=v_max, max_accelerations=a_max)
+    curve_collision_fn = get_curve_collision_fn(collision_fn, batch_collision_fn=batch_collision_fn,
+                                                max_velocities=v_max, max_accelerations=a_max)
     positions_curve = smooth_curve(positions_curve,
                                    #v_max=None, a_max=None,
                                    v_max=v_max,
@@ -126,6 +138,22 @@ def problem1():
 
 ##################################################
 
+def solve_restart(start, goal, environment, obstacles, algorithm, seed, max_time, num_samples=200):
+    # Worker for parallel restarts: must be a top-level function (pickling) and
+    # reseeds so that every process draws an independent, reproducible stream
+    random.seed(seed)
+    np.random.seed(seed)
+    distance_fn = get_distance_fn(weights=[1, 1]) # distance_fn
+    collision_fn, cfree = get_collision_fn(environment, obstacles)
+    sample_fn, samples = get_sample_fn(environment, obstacles=[], use_halton=False) # obstacles
+    extend_fn, roadmap = get_extend_fn(environment, obstacles=obstacles)  # obstacles | []
+    path = solve(start, goal, distance_fn, sample_fn, extend_fn, collision_fn,
+                 max_time=max_time, max_iterations=INF, num_samples=num_samples,
+                 restarts=2, smooth=0, algorithm=algorithm)
+    return path, samples, roadmap
+
+##################################################
+
 def main():
     """
     Creates and solves the 2D motion planning problem.
@@ -178,30 +206,34 @@ def main():
 
     #connected_test, roadmap = get_connected_test(obstacles)
     distance_fn = get_distance_fn(weights=[1, 1]) # distance_fn
+    collision_fn, cfree = get_collision_fn(environment, obstacles)
+    batch_collision_fn = get_batch_collision_fn(environment, obstacles)
 
     # samples = list(islice(region_gen('env'), 100))
     with profiler(field='cumtime'): # cumtime | tottime
         # TODO: cost bound & best cost
-        for _ in range(args.restarts+1):
-            start_time = time.time()
-            collision_fn, cfree = get_collision_fn(environment, obstacles)
-            sample_fn, samples = get_sample_fn(environment, obstacles=[], use_halton=False) # obstacles
-            extend_fn, roadmap = get_extend_fn(environment, obstacles=obstacles)  # obstacles | []
-
-            path = solve(start, goal, distance_fn, sample_fn, extend_fn, collision_fn,
-                         max_time=args.time, max_iterations=INF, num_samples=200,
-                         restarts=2, smooth=0, algorithm=args.algorithm)
+        start_time = time.time()
+        num_restarts = args.restarts + 1
+        solve_args = [(start, goal, environment, obstacles, args.algorithm, seed + i, args.time)
+                      for i in range(num_restarts)]
+        if num_restarts == 1:
+            results = [solve_restart(*solve_args[0])]
+        else:
+            # The restarts are independent and CPU-bound: run one process each
+            with ProcessPoolExecutor(max_workers=min(num_restarts, os.cpu_count())) as executor:
+                results = list(executor.map(solve_restart, *zip(*solve_args)))
+
+        #paths = random_restarts(rrt_connect, start, goal, distance_fn=distance_fn, sample_fn=sample_fn,
+        #                         extend_fn=extend_fn, collision_fn=collision_fn, restarts=INF,
+        #                         max_time=args.time, max_solutions=INF, smooth=100) #, smooth=1000, **kwargs)
+
+        # paths = exhaustively_select_portfolio(paths, k=2)
+        # print(score_portfolio(paths))
+
+        #########################
+
+        for path, samples, roadmap in results:
             paths = [] if path is None else [path]
-
-            #paths = random_restarts(rrt_connect, start, goal, distance_fn=distance_fn, sample_fn=sample_fn,
-            #                         extend_fn=extend_fn, collision_fn=collision_fn, restarts=INF,
-            #                         max_time=args.time, max_solutions=INF, smooth=100) #, smooth=1000, **kwargs)
-
-            # paths = exhaustively_select_portfolio(paths, k=2)
-            # print(score_portfolio(paths))
-
-            #########################
-
             if args.draw:
                 # roadmap = samples = cfree = []
                 add_roadmap(viewer, roadmap, color='black')
@@ -215,7 +247,8 @@ def main():
                 path = waypoints_from_path(path)
                 add_path(viewer, path, color='green')
                 #curve = interpolate_path(path) # , collision_fn=collision_fn)
-                curve = retime_path(path, collision_fn=collision_fn, smooth=True)
+                curve = retime_path(path, collision_fn=collision_fn,
+                                    batch_collision_fn=batch_collision_fn, smooth=True)
                 times, path = time_discretize_curve(curve)
                 times = [np.linalg.norm(curve(t, nu=1), ord=INF) for t in times]
                 #add_points(viewer, [curve(t) for t in curve.x])
@@ -228,7 +261,7 @@ def main():
                     smoothed = smooth_path(path, extend_fn, collision_fn, max_iterations=INF, max_time=args.time)
                     print('Smoothed distance_fn: {:.3f}'.format(compute_path_cost(smoothed, distance_fn)))
                     add_path(viewer, smoothed, color='red')
-            user_input('Finish?')
+        user_input('Finish?')
 
 if __name__ == '__main__':
     main()
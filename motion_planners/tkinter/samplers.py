@@ -2,7 +2,8 @@ import math
 
 import numpy as np
 
-from .viewer import is_collision_free, contains, point_collides, sample_line
+from .viewer import is_collision_free, contains, point_collides, sample_line, \
+    Box, Circle, MIN_PROXIMITY
 from ..utils import interval_generator, get_distance, get_delta
 
 def get_distance_fn(weights):
@@ -70,6 +71,33 @@ def get_collision_fn(environment, obstacles):
     return collision_fn, cfree
 
 
+def get_batch_collision_fn(environment, obstacles, buffer=MIN_PROXIMITY, dtype=np.float32):
+    # Vectorized version of get_collision_fn taking an (M, d) array of points
+    # The obstacle geometry is fixed, so gather it into arrays once
+    # float32 suffices for buffered AABB/circle tests and halves the bandwidth
+    assert all(isinstance(obstacle, (Box, Circle)) for obstacle in obstacles)
+    env_lower, env_upper = np.asarray(environment, dtype=dtype)
+    boxes = [obstacle for obstacle in obstacles if isinstance(obstacle, Box)]
+    box_lower = (np.array([lower for lower, _ in boxes]) - buffer).astype(dtype) # (K, d)
+    box_upper = (np.array([upper for _, upper in boxes]) + buffer).astype(dtype)
+    circles = [obstacle for obstacle in obstacles if isinstance(obstacle, Circle)]
+    centers = np.array([center for center, _ in circles], dtype=dtype) # (K, d)
+    radii = (np.array([radius for _, radius in circles]) + buffer).astype(dtype)
+
+    def batch_collision_fn(points):
+        points = np.asarray(points, dtype=dtype)
+        colliding = ~(np.greater_equal(points, env_lower).all(axis=1) &
+                      np.less_equal(points, env_upper).all(axis=1))
+        if boxes:
+            colliding |= (np.greater_equal(points[:, None, :], box_lower[None]) &
+                          np.less_equal(points[:, None, :], box_upper[None])).all(axis=-1).any(axis=-1)
+        if circles:
+            colliding |= (np.linalg.norm(points[:, None, :] - centers[None], axis=-1) <= radii[None]).any(axis=-1)
+        return colliding
+
+    return batch_collision_fn
+
+
 def get_extend_fn(environment, obstacles=[]):
     collision_fn, _ = get_collision_fn(environment, obstacles)
     roadmap = []
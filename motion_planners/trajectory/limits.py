@@ -45,6 +45,22 @@ def old_check_spline(spline, v_max=None, a_max=None, start_idx=None, end_idx=Non
                     return False
     return True
 
+def find_max_velocity_cubic(spline):
+    # Closed-form equivalent of find_max_velocity for a cubic PPoly
+    # Each segment velocity is quadratic with its extremum at t* = -c1/(3*c0),
+    # so the candidates (segment ends + interior extrema) vectorize over segments x dims
+    c = spline.c # (4, num_segments, d)
+    dx = np.diff(spline.x)[:, None] # local segment widths
+    velocity = lambda t: (3.*c[0]*t + 2.*c[1])*t + c[2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_ext = np.true_divide(-c[1], 3.*c[0])
+    t_ext = np.clip(np.where(np.isfinite(t_ext), t_ext, 0.), 0., dx)
+    ts = np.stack([np.zeros_like(t_ext), np.broadcast_to(dx, t_ext.shape), t_ext])
+    vs = np.abs(velocity(ts))
+    index = np.unravel_index(np.argmax(vs), vs.shape)
+    max_t = spline.x[index[1]] + ts[index]
+    return max_t, vs[index]
+
 def check_spline(spline, v_max=None, a_max=None, verbose=False, **kwargs):
     if (v_max is None) and (a_max is None):
         return True
@@ -62,7 +78,11 @@ def check_spline(spline, v_max=None, a_max=None, verbose=False, **kwargs):
 
     if v_max is not None:
         # TODO: maybe the pieces are screwing something
-        t, v = find_max_velocity(spline, **kwargs)
+        if (getattr(spline, 'c', None) is not None) and (spline.c.ndim == 3) \
+                and (spline.c.shape[0] == 4) and not kwargs:
+            t, v = find_max_velocity_cubic(spline)
+        else:
+            t, v = find_max_velocity(spline, **kwargs)
         violation = abs(v) > get_max_velocity(v_max) + EPSILON
         if verbose: # or violation:
             print('Violation: {} | Max velocity: {:.3f}/{:.3f} (at time {:.3f})'.format(
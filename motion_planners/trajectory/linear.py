@@ -3,7 +3,7 @@ import math
 import numpy as np
 
 from .limits import maximize_curve
-from .retime import EPSILON, curve_from_controls, check_time, parabolic_val, append_polys
+from .retime import EPSILON, curve_from_controls, check_time, parabolic_val, append_polys, spline_duration
 from ..utils import INF, get_sign, waypoints_from_path, get_pairs
 
 def quickest_inf_accel(x1, x2, v_max=INF):
@@ -20,20 +20,13 @@ def acceleration_cost(p_curve, **kwargs):
     return max_a
 
 def find_lower_bound(x1, x2, v1=None, v2=None, v_max=None, a_max=None):
-    d = len(x1)
-    if v_max is None:
-        v_max = np.full(d, INF)
-    if a_max is None:
-        a_max = np.full(d, INF)
-    lower_bounds = [
+    lower_bound = 0.
+    if v_max is not None:
         # Instantaneously accelerate
-        np.linalg.norm(np.divide(np.subtract(x2, x1), v_max), ord=INF),
-    ]
-    if (v1 is not None) and (v2 is not None):
-        lower_bounds.extend([
-            np.linalg.norm(np.divide(np.subtract(v2, v1), a_max), ord=INF),
-        ])
-    return max(lower_bounds)
+        lower_bound = (np.abs(np.subtract(x2, x1)) / v_max).max()
+    if (v1 is not None) and (v2 is not None) and (a_max is not None):
+        lower_bound = max(lower_bound, (np.abs(np.subtract(v2, v1)) / a_max).max())
+    return lower_bound
 
 def check_curve(p_curve, x1, x2, v1, v2, T, v_max=INF, a_max=INF):
     assert p_curve is not None
@@ -157,6 +150,26 @@ def opt_straight_line(x1, x2, v_max=INF, a_max=INF, T_min=0.):
     check_curve(p_curve, x1, x2, v1=0., v2=0., T=T, v_max=v_max, a_max=a_max)
     return p_curve
 
+def opt_straight_line_durations(waypoints, v_max, a_max):
+    # Vectorized version of opt_straight_line applied to all pairs x dims at once
+    # Assumes rest-to-rest segments (like opt_straight_line)
+    waypoints = np.asarray(waypoints)
+    num, d = waypoints.shape
+    assert np.greater(v_max, 0.).all() and np.greater(a_max, 0.).all()
+    durations = np.zeros(num)
+    if np.isinf(v_max).any() or np.isinf(a_max).any():
+        # Degenerate limits involve epsilon shifts (see opt_straight_line)
+        durations[1:] = [max(spline_duration(opt_straight_line(x1[k], x2[k], v_max=v_max[k], a_max=a_max[k]))
+                             for k in range(d)) for x1, x2 in get_pairs(list(waypoints))]
+        return durations
+    dx = np.abs(np.diff(waypoints, axis=0))
+    # Triangular profile when v_max cannot be reached, trapezoidal otherwise
+    pair_durations = np.where(dx <= np.square(v_max) / a_max,
+                              2.*np.sqrt(dx / a_max),
+                              dx / v_max + v_max / a_max)
+    durations[1:] = pair_durations.max(axis=1)
+    return durations
+
 ##################################################
 
 def solve_multi_linear(positions, v_max=None, a_max=None, **kwargs):
@@ -3,7 +3,7 @@ import numpy as np
 from .linear import quickest_inf_accel, acceleration_cost, check_curve
 from .retime import curve_from_controls, check_time, spline_duration, append_polys, \
     MultiPPoly, EPSILON
-from ..utils import INF, get_pairs
+from ..utils import INF, get_pairs, njit
 
 
 def min_two_ramp(x1, x2, v1, v2, T, a_max, v_max=INF):
@@ -147,6 +147,18 @@ def min_spline(times, positions, velocities, **kwargs):
         splines.append(spline)
     return append_polys(*splines)
 
+def solve_multi_ramp(x1, x2, v1, v2, T, v_max, a_max, **kwargs):
+    # Two-knot specialization of solve_multi_poly for the shortcut loop
+    # Skips the per-pair bookkeeping in min_spline since there is a single segment
+    assert T > 0
+    splines = []
+    for k in range(len(x1)):
+        spline = min_stage(x1[k], x2[k], v1[k], v2[k], T, v_max=v_max[k], a_max=a_max[k], **kwargs)
+        if spline is None:
+            return None
+        splines.append(spline)
+    return MultiPPoly(splines)
+
 def solve_multi_poly(times, positions, velocities, v_max, a_max, **kwargs):
     assert len(times) == len(positions) == len(velocities)
     d = len(positions[0])
@@ -190,7 +202,59 @@ def quickest_stage(x1, x2, v1, v2, v_max=INF, a_max=INF, min_t=0.):
     T = min(t for t in candidates)
     return max(min_t, T)
 
+def quickest_stage_kernel(x1, x2, v1, v2, v_max, a_max):
+    # Closed-form quickest_stage for finite limits (quadratics solved via the
+    # discriminant instead of np.roots) so that numba can compile the scalar math
+    # Returns -1. when infeasible
+    best = -1.
+    for sign in (+1., -1.):
+        a = sign*a_max
+        v = sign*v_max
+        # quickest_two_ramp
+        b = 2.*v1
+        c = (v1*v1 - v2*v2) / (2.*a) + (x1 - x2)
+        disc = b*b - 4.*a*c
+        if disc >= 0.:
+            root = np.sqrt(disc)
+            t = INF
+            for candidate in ((-b - root) / (2.*a), (-b + root) / (2.*a)):
+                if (0. <= candidate <= abs(v_max) / abs(a)) and \
+                        (abs(v1 + candidate*a) <= abs(v_max) + EPSILON) and (candidate < t):
+                    t = candidate
+            if t < INF:
+                T = 2.*t + (v1 - v2) / a
+                if (T >= 0.) and ((best < 0.) or (T < best)):
+                    best = T
+        # quickest_three_stage
+        tp1 = (v - v1) / a
+        tl = (v2*v2 + v1*v1 - 2.*v*v) / (2.*v*a) + (x2 - x1) / v
+        tp2 = (v2 - v) / -a
+        if (tp1 >= 0.) and (tl >= 0.) and (tp2 >= 0.):
+            T = tp1 + tl + tp2
+            if (best < 0.) or (T < best):
+                best = T
+    return best
+
+def solve_multivariate_ramp_kernel(x1, x2, v1, v2, v_max, a_max):
+    T = 0.
+    for k in range(len(x1)):
+        t = quickest_stage_kernel(x1[k], x2[k], v1[k], v2[k], v_max[k], a_max[k])
+        if t < 0.:
+            return -1.
+        T = max(T, t)
+    return T
+
+if njit is not None:
+    quickest_stage_kernel = njit(cache=True, fastmath=True)(quickest_stage_kernel)
+    solve_multivariate_ramp_kernel = njit(cache=True, fastmath=True)(solve_multivariate_ramp_kernel)
+
 def solve_multivariate_ramp(x1, x2, v1, v2, v_max, a_max):
+    if np.isfinite(v_max).all() and np.isfinite(a_max).all():
+        T = solve_multivariate_ramp_kernel(np.asarray(x1), np.asarray(x2),
+                                           np.asarray(v1), np.asarray(v2),
+                                           np.asarray(v_max), np.asarray(a_max))
+        return None if (T < 0.) else T
+    # Infinite limits involve special cases: defer to the scalar solver
     d = len(x1)
     durations = [quickest_stage(x1[i], x2[i], v1[i], v2[i], v_max[i], a_max[i]) for i in range(d)]
     if any(duration is None for duration in durations):
@@ -3,15 +3,16 @@ import time
 
 import numpy as np
 
-from .linear import find_lower_bound
 from .limits import check_spline
 from .discretize import time_discretize_curve
-from .parabolic import solve_multi_poly, solve_multivariate_ramp
+from .parabolic import solve_multi_poly, solve_multi_ramp, solve_multivariate_ramp
 from .retime import EPSILON, trim, spline_duration, append_polys
-from ..utils import INF, elapsed_time, get_pairs, find, default_selector
+from ..utils import INF, elapsed_time, default_selector, njit
 
 
-def get_curve_collision_fn(collision_fn=lambda q: False, max_velocities=None, max_accelerations=None): # a_max
+def get_curve_collision_fn(collision_fn=lambda q: False, batch_collision_fn=None,
+                           max_velocities=None, max_accelerations=None, coarse_factor=8): # a_max
+    buffer = [np.empty((0, 0))] # persistent samples buffer, grown on demand
 
     def curve_collision_fn(curve, t0=None, t1=None):
         # TODO: stage the function to check all the easy things like joint limits first
@@ -26,6 +27,29 @@ def get_curve_collision_fn(collision_fn=lambda q: False, max_velocities=None, ma
                                            start_t=t0, end_t=t1,
                                            #max_velocities=v_max,
                                            )
+        num = len(samples) - 2 # the endpoints lie on an already-feasible curve
+        if num <= 0:
+            return False
+        d = len(samples[0])
+        if (buffer[0].shape[0] < num) or (buffer[0].shape[1] != d):
+            # Double the capacity so repeated calls settle on one allocation
+            buffer[0] = np.empty((max(num, 2*buffer[0].shape[0]), d))
+        buffer[0][:num] = samples[1:-1]
+        samples = buffer[0][:num]
+        if batch_collision_fn is not None:
+            # One vectorized call over all samples instead of one call per sample
+            # (the checker casts to its own working precision)
+            if coarse_factor > 1:
+                # Broad phase: a strided subset rejects most colliding candidates early
+                if batch_collision_fn(samples[::coarse_factor]).any():
+                    return True
+                remainder = np.ones(len(samples), dtype=bool)
+                remainder[::coarse_factor] = False
+                samples = samples[remainder]
+                if len(samples) == 0:
+                    return False
+            return bool(batch_collision_fn(samples).any())
+        # default_selector already visits the samples in a coarse-to-fine (bisecting) order
         if any(map(collision_fn, default_selector(samples))):
            return True
         return False
@@ -33,8 +57,63 @@ def get_curve_collision_fn(collision_fn=lambda q: False, max_velocities=None, ma
 
 ##################################################
 
+def splice_arrays(prefix, middle, suffix):
+    # np.concatenate([prefix, middle, suffix]) into a preallocated buffer
+    num = len(prefix) + len(middle) + len(suffix)
+    spliced = np.empty((num,) + np.shape(prefix)[1:])
+    spliced[:len(prefix)] = prefix
+    spliced[len(prefix):len(prefix) + len(middle)] = middle
+    spliced[len(prefix) + len(middle):] = suffix
+    return spliced
+
+
+def hermite_coefficients(x1, v1, x2, v2, dt):
+    # PPoly coefficients (highest order first) of the cubic Hermite segment
+    # from (x1, v1) to (x2, v2) over local time [0, dt]
+    c3 = (2.*(x1 - x2)/dt + (v1 + v2)) / dt**2
+    c2 = (3.*(x2 - x1)/dt - (2.*v1 + v2)) / dt
+    return np.stack([c3, c2, v1, x1])
+
+
+def splice_curve(curve, i1, i2, t1, t2, local_x, local_c, x2, v2, x3, v3):
+    # Incremental alternative to refitting a CubicHermiteSpline over every knot:
+    # Hermite refitting reproduces the retained (<= cubic) segments exactly, so only
+    # the spliced window needs new coefficients while the tail knots just shift
+    from scipy.interpolate import PPoly
+    times = curve.x
+    bridge_c = hermite_coefficients(x2, v2, x3, v3, times[i2] - t2)[:, None, :] # [t2, times[i2]]
+    blocks = [curve.c[:, :i1 + 1], local_c, bridge_c, curve.c[:, i2:]]
+    order = max(block.shape[0] for block in blocks)
+    blocks = [np.pad(block, [(order - block.shape[0], 0)] + [(0, 0)]*(block.ndim - 1))
+              for block in blocks]
+    local_knots = t1 + (np.asarray(local_x) - local_x[0])
+    bridge_end = local_knots[-1] + (times[i2] - t2)
+    new_x = np.concatenate([times[:i1 + 1], local_knots, bridge_end + (times[i2:] - times[i2])])
+    return PPoly.construct_fast(np.concatenate(blocks, axis=1), new_x)
+
+
+def screen_shortcut(x1, x2, v1, v2, v_max, inv_v_max, inv_a_max):
+    # Candidate screen for smooth_curve: the lower bound on the shortcut duration,
+    # or -1. if a boundary velocity exceeds v_max (see find_lower_bound)
+    # Typed loops instead of ufuncs so that numba can compile this when available
+    # The reciprocal limits are hoisted by the caller: multiplies, not divides
+    min_t = 0.
+    for k in range(len(x1)):
+        if (abs(v1[k]) > v_max[k] + EPSILON) or (abs(v2[k]) > v_max[k] + EPSILON):
+            return -1.
+        min_t = max(min_t,
+                    abs(x2[k] - x1[k]) * inv_v_max[k],
+                    abs(v2[k] - v1[k]) * inv_a_max[k])
+    return min_t
+
+if njit is not None:
+    screen_shortcut = njit(cache=True, fastmath=True)(screen_shortcut)
+
+##################################################
+
 def smooth_curve(start_curve, v_max, a_max, curve_collision_fn,
-                 sample=True, intermediate=True, cubic=True, refit=True, num=1000, min_improve=0., max_time=INF):
+                 sample=True, intermediate=True, cubic=True, refit=True, num=1000, min_improve=0., max_time=INF,
+                 seed=None, num_candidates=100):
     # TODO: rename smoothing.py to shortcutting.py
     # TODO: default v_max and a_max
     assert (num < INF) or (max_time < INF)
@@ -48,36 +127,44 @@ def smooth_curve(start_curve, v_max, a_max, curve_collision_fn,
         #return None
         return start_curve
     curve = start_curve
+    velocities_curve = curve.derivative() # only changes when curve does
+    current_duration = spline_duration(curve)
+    rng = np.random.default_rng(seed)
+    candidates = np.empty((0, 2)) # batches of presorted (t1, t2) pairs
+    candidate_index = 0
+    inv_v_max, inv_a_max = 1. / np.asarray(v_max), 1. / np.asarray(a_max) # hoisted reciprocals
     for iteration in range(num):
         if elapsed_time(start_time) >= max_time:
             break
         times = curve.x
-        durations = [0.] + [t2 - t1 for t1, t2 in get_pairs(times)] # includes start
-        positions = [curve(t) for t in times]
-        velocities = [curve(t, nu=1) for t in times]
 
         # ts = [times[0], times[-1]]
         # t1, t2 = curve.x[0], curve.x[-1]
-        t1, t2 = np.random.uniform(times[0], times[-1], 2) # TODO: sample based on position
-        if t1 > t2: # TODO: minimum distance from a knot
-            t1, t2 = t2, t1
+        if candidate_index >= len(candidates): # regenerated when the domain changes
+            candidates = rng.uniform(times[0], times[-1], size=(num_candidates, 2)) # TODO: sample based on position
+            candidates.sort(axis=1) # TODO: minimum distance from a knot
+            candidate_index = 0
+        t1, t2 = candidates[candidate_index]
+        candidate_index += 1
 
         ts = [t1, t2]
-        i1 = find(lambda i: times[i] <= t1, reversed(range(len(times)))) # index before t1
-        i2 = find(lambda i: times[i] >= t2, range(len(times))) # index after t2
+        i1 = int(np.searchsorted(times, t1, side='right')) - 1 # index before t1
+        i2 = int(np.searchsorted(times, t2, side='left')) # index after t2
+        assert (times[i1] <= t1) and (t2 <= times[i2])
         assert i1 != i2
 
-        local_positions = [curve(t) for t in ts]
-        local_velocities = [curve(t, nu=1) for t in ts]
+        local_positions = curve(ts)
+        local_velocities = velocities_curve(ts)
         #print(local_velocities, v_max)
-        assert all(np.less_equal(np.absolute(v), v_max + EPSILON).all() for v in local_velocities)
-        #if any(np.greater(np.absolute(v), v_max).any() for v in local_velocities):
-        #    continue # TODO: do the same with collisions
         x1, x2 = local_positions
         v1, v2 = local_velocities
 
         #min_t = 0
-        min_t = find_lower_bound(x1, x2, v1, v2, v_max=v_max, a_max=a_max)
+        #min_t = find_lower_bound(x1, x2, v1, v2, v_max=v_max, a_max=a_max)
+        min_t = screen_shortcut(x1, x2, v1, v2, v_max, inv_v_max, inv_a_max)
+        assert min_t >= 0. # Boundary velocities within v_max
+        #if min_t < 0.:
+        #    continue # TODO: do the same with collisions
         #min_t = optimistic_time(x1, x2, v_max=v_max, a_max=a_max)
         current_t = (t2 - t1) - min_improve
         if min_t >= current_t: # TODO: also limit the distance/duration between these two points
@@ -104,35 +191,45 @@ def smooth_curve(start_curve, v_max, a_max, curve_collision_fn,
             if cubic:
                 local_curve = CubicHermiteSpline(local_times, local_positions, dydx=local_velocities)
             else:
-                local_curve = solve_multi_poly(times=local_times, positions=local_positions,
-                                               velocities=local_velocities,
+                local_curve = solve_multi_ramp(x1, x2, v1, v2, best_t,
                                                v_max=v_max, a_max=a_max)
-            if (local_curve is None) or (spline_duration(local_curve) >= current_t) \
+            if (local_curve is None) or ((local_curve.x[-1] - local_curve.x[0]) >= current_t) \
                     or curve_collision_fn(local_curve, t0=None, t1=None):
                 continue
             # print(new_curve.hermite_spline().c[0,...])
-            local_positions = [local_curve(x) for x in local_curve.x]
-            local_velocities = [local_curve(x, nu=1) for x in local_curve.x]
+            local_positions = local_curve(local_curve.x)
+            local_velocities = local_curve(local_curve.x, nu=1)
             local_durations = [t1 - times[i1]] + [x - local_curve.x[0]
                                                     for x in local_curve.x[1:]] + [times[i2] - t2]
 
         if refit:
-            new_durations = np.concatenate([
-                durations[:i1 + 1], local_durations, durations[i2 + 1:]])
-            # assert len(new_durations) == (i1 + 1) + (len(durations) - i2) + 2
-            new_times = np.cumsum(new_durations)
-            # new_times = [new_times[0]] + [t2 for t1, t2 in get_pairs(new_times) if t2 > t1]
-            new_positions = positions[:i1 + 1] + local_positions + positions[i2:]
-            new_velocities = velocities[:i1 + 1] + local_velocities + velocities[i2:]
-            # if not all(np.less_equal(np.absolute(v), v_max).all() for v in new_velocities):
-            #    continue
             if cubic:
                 # new_curve = CubicSpline(new_times, new_positions)
-                new_curve = CubicHermiteSpline(new_times, new_positions, dydx=new_velocities)
+                # new_curve = CubicHermiteSpline(new_times, new_positions, dydx=new_velocities)
+                if intermediate:
+                    local_x, local_c = local_curve.x, local_curve.c
+                else:
+                    local_x = local_times
+                    local_c = hermite_coefficients(x1, v1, x2, v2, best_t)[:, None, :]
+                new_curve = splice_curve(curve, i1, i2, t1, t2, local_x, local_c,
+                                         x2, v2, curve(times[i2]), velocities_curve(times[i2]))
             else:
+                durations = np.append([0.], np.diff(times)) # includes start
+                positions = curve(times) # (N, d) | one C-level evaluation instead of N
+                velocities = velocities_curve(times)
+                new_durations = splice_arrays(durations[:i1 + 1], local_durations, durations[i2 + 1:])
+                # assert len(new_durations) == (i1 + 1) + (len(durations) - i2) + 2
+                new_times = np.cumsum(new_durations)
+                # new_times = [new_times[0]] + [t2 for t1, t2 in get_pairs(new_times) if t2 > t1]
+                new_positions = splice_arrays(positions[:i1 + 1], local_positions, positions[i2:])
+                new_velocities = splice_arrays(velocities[:i1 + 1], local_velocities, velocities[i2:])
+                # if not all(np.less_equal(np.absolute(v), v_max).all() for v in new_velocities):
+                #    continue
                 new_curve = solve_multi_poly(new_times, new_positions, new_velocities, v_max, a_max)
-            if (new_curve is None) or (spline_duration(new_curve) >= spline_duration(curve)) \
-                    or not check_spline(new_curve, v_max, a_max) or \
+            if new_curve is None:
+                continue
+            new_duration = new_curve.x[-1] - new_curve.x[0] # spline_duration without the call overhead
+            if (new_duration >= current_duration) or not check_spline(new_curve, v_max, a_max) or \
                     (not intermediate and curve_collision_fn(new_curve, t0=None, t1=None)):
                 continue
         else:
@@ -153,13 +250,17 @@ def smooth_curve(start_curve, v_max, a_max, curve_collision_fn,
             # print(new_curve.x)
             # print(new_curve.c[...,0])
             #assert(not curve_collision_fn(new_curve, t0=None, t1=None))
-            if (spline_duration(new_curve) >= spline_duration(curve)) or \
+            new_duration = new_curve.x[-1] - new_curve.x[0]
+            if (new_duration >= current_duration) or \
                     not check_spline(new_curve, v_max, a_max):
                 continue
         print('Iterations: {} | Current time: {:.3f} | New time: {:.3f} | Elapsed time: {:.3f}'.format(
-            iteration, spline_duration(curve), spline_duration(new_curve), elapsed_time(start_time)))
+            iteration, current_duration, new_duration, elapsed_time(start_time)))
         curve = new_curve
+        velocities_curve = curve.derivative()
+        current_duration = new_duration
+        candidate_index = len(candidates) # the sampling domain has shrunk
     print('Iterations: {} | Start time: {:.3f} | End time: {:.3f} | Elapsed time: {:.3f}'.format(
-        num, spline_duration(start_curve), spline_duration(curve), elapsed_time(start_time)))
+        num, spline_duration(start_curve), current_duration, elapsed_time(start_time)))
     check_spline(curve, v_max, a_max)
     return curve
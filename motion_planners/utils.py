@@ -9,6 +9,11 @@ import random
 
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 INF = float('inf')
 
 RRT_ITERATIONS = 20
@@ -176,7 +181,7 @@ def get_difference(q2, q1):
 
 
 def remove_redundant(path, tolerance=1e-3):
-    assert path
+    assert len(path) != 0 # supports (N, d) arrays
     new_path = [path[0]]
     for conf in path[1:]:
         difference = get_difference(new_path[-1], np.array(conf))